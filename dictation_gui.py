@@ -5,15 +5,20 @@ the dictation daemon for transcription, and pastes the result."""
 import gi
 
 gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk, Gdk, GLib, Pango
-
+gi.require_version("PangoCairo", "1.0")
+from gi.repository import Gtk, Gdk, Gio, GLib, Pango, PangoCairo
+from Xlib import X, XK, Xatom, display as xdisplay, error as xerror, protocol
+from Xlib.ext import xtest
+
+import array
+import fcntl
+import mmap
 import os
 import socket
 import sounddevice as sd
+import struct
 import numpy as np
-import pyperclip
-import queue
-import subprocess
+import sys
 import threading
 import time
 
@@ -24,26 +29,222 @@ import time
 WHISPER_RATE = 16000
 CHANNELS = 1
 BLOCK_MS = 30
+RING_SLOTS = 64  # ~2s of 30ms blocks between audio callback and writer
+SEND_BATCH = 16  # max ring slots coalesced into one sendmsg()
+SOCK_SNDBUF = 256 * 1024
+RECV_BUF_SIZE = 65536
+# Shared-memory audio ring handed to the daemon (layout shared with
+# dictation_server.py): a header holding write_pos at offset 0 and read_pos
+# at offset 8, both running byte totals, followed by the ring data
+SHM_HEADER = 64
+SHM_RING_BYTES = 1 << 20  # ~32s of int16 audio
+SHM_HELLO = b"M"  # first byte on the socket; carries the memfd
+SHM_SEALS = fcntl.F_SEAL_SHRINK | fcntl.F_SEAL_GROW | fcntl.F_SEAL_SEAL
+SHM_FULL_TIMEOUT_S = 2.0  # daemon drains every 50ms; a full ring means it's stuck
+HELLO_TIMEOUT_S = 30.0  # max wait for H; only a headset switch or another popup still recording delays it
+SEND_TIMEOUT_S = 5.0  # max stall of one audio write; SOCK_SNDBUF holds ~8s
 SOCKET_PATH = os.path.join(os.environ.get("XDG_RUNTIME_DIR", "/tmp"), "dictation.sock")
+ACTIVATE_TIMEOUT_S = 0.5  # max wait for the WM to focus the paste target
 
 # =========================
 # Audio capture
 # =========================
 
-audio_queue = queue.Queue()
 capture_rate = WHISPER_RATE
+resampler = None  # LinearResampler, set up once capture_rate is known
+audio_ring = None  # SPSCRing, sized once the block size is known
+
+
+class SPSCRing:
+    """Single-producer/single-consumer ring of preallocated int16 slabs.
+
+    The audio callback is the only producer and the writer thread the only
+    consumer. Each side only ever stores to its own index (tail resp. head),
+    and int stores are atomic under the GIL, so the slots need no lock.
+    The ready event only wakes the consumer; it carries no data, and the
+    producer only sets it (taking the event's internal lock) when it is
+    clear, i.e. when the consumer may be asleep."""
+
+    def __init__(self, max_block, slots=RING_SLOTS):
+        self.slots = slots
+        self.slabs = [np.empty(max_block, dtype=np.int16) for _ in range(slots)]
+        self.lengths = array.array("i", [0] * slots)
+        self.head = 0  # next slot to read, advanced only by the consumer
+        self.tail = 0  # next slot to write, advanced only by the producer
+        self.dropped = 0
+        self.ready = threading.Event()
+
+    def claim(self):
+        """Return the next free slab for the producer to fill, or None if the
+        ring is full. A full ring drops the block, since the realtime thread
+        must never wait for the writer."""
+        tail = self.tail
+        if tail - self.head >= self.slots:
+            self.dropped += 1
+            return None
+        return self.slabs[tail % self.slots]
+
+    def commit(self, n):
+        """Publish the slab returned by claim() holding n samples."""
+        tail = self.tail
+        self.lengths[tail % self.slots] = n
+        self.tail = tail + 1
+        # Skip the event's lock while it's still set: the consumer clears it
+        # before re-checking with peek(), which then sees the new tail
+        if not self.ready.is_set():
+            self.ready.set()
+
+    def peek(self, limit):
+        """Return [(slab, n), ...] for up to limit of the oldest filled slots,
+        oldest first. Empty if the ring is empty."""
+        head = self.head
+        count = min(self.tail - head, limit)
+        return [(self.slabs[i % self.slots], self.lengths[i % self.slots])
+                for i in range(head, head + count)]
+
+    def pop(self, count):
+        """Hand count slots returned by peek() back to the producer."""
+        self.head += count
+
+    def wait(self):
+        """Block the consumer until the producer commits a slot or wake() is
+        called. May return spuriously; callers re-check with peek()."""
+        self.ready.wait()
+        self.ready.clear()
+
+    def wake(self):
+        """Wake a consumer blocked in wait(), e.g. to let it see a stop flag."""
+        self.ready.set()
+
+
+def sendmsg_all(sock, bufs):
+    """Write a list of byte buffers with as few sendmsg() calls as possible,
+    retrying on partial writes."""
+    while bufs:
+        sent = sock.sendmsg(bufs)
+        while sent:
+            if sent >= len(bufs[0]):
+                sent -= len(bufs.pop(0))
+            else:
+                bufs[0] = bufs[0][sent:]
+                sent = 0
+
+
+class ShmAudioRing:
+    """Byte ring in a memfd shared with the daemon, used instead of socket
+    writes for audio. The writer copies into the mapping and publishes
+    write_pos; the daemon polls it and publishes read_pos. Each position is
+    stored by one side only, as an aligned 8-byte word."""
+
+    def __init__(self, size=SHM_RING_BYTES):
+        self.size = size
+        self.write_pos = 0
+        self.fd = os.memfd_create("dictation-audio", os.MFD_CLOEXEC | os.MFD_ALLOW_SEALING)
+        try:
+            os.ftruncate(self.fd, SHM_HEADER + size)
+            # The daemon refuses rings whose size isn't locked in: a shrunk
+            # memfd would SIGBUS it
+            fcntl.fcntl(self.fd, fcntl.F_ADD_SEALS, SHM_SEALS)
+            self.mm = mmap.mmap(self.fd, SHM_HEADER + size)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def attach(self, sock):
+        """Pass the ring to the daemon over the socket (SCM_RIGHTS)."""
+        try:
+            socket.send_fds(sock, [SHM_HELLO], [self.fd])
+        except OSError:
+            self.mm.close()  # the caller falls back to the socket path
+            raise
+        finally:
+            os.close(self.fd)  # the mapping keeps the memory alive
+
+    def write(self, bufs):
+        """Copy a list of byte buffers into the ring and publish them."""
+        for buf in bufs:
+            n = len(buf)
+            deadline = time.monotonic() + SHM_FULL_TIMEOUT_S
+            while self.size - (self.write_pos - struct.unpack_from("Q", self.mm, 8)[0]) < n:
+                if time.monotonic() >= deadline:
+                    raise BrokenPipeError("daemon stopped reading audio")
+                time.sleep(0.005)
+            off = self.write_pos % self.size
+            first = min(n, self.size - off)
+            self.mm[SHM_HEADER + off:SHM_HEADER + off + first] = buf[:first]
+            if first < n:
+                self.mm[SHM_HEADER:SHM_HEADER + n - first] = buf[first:]
+            self.write_pos += n
+        struct.pack_into("Q", self.mm, 0, self.write_pos)
+
+    def close(self):
+        self.mm.close()
+
+
+class LinearResampler:
+    """Fixed-ratio linear resampler for the realtime audio callback.
+
+    Works on int16 PCM in pure integer arithmetic. All scratch buffers are
+    preallocated for the stream's block size, and output is written straight
+    into the caller's slab, so process() does no array allocation. The read
+    position is a Q32.32 fixed-point offset from the last sample of the
+    previous block, which keeps interpolation continuous across block
+    boundaries."""
+
+    def __init__(self, in_rate, out_rate, max_frames):
+        self.step = (in_rate << 32) // out_rate
+        self.pos = 1 << 32  # first output sample lands on the first input sample
+        max_out = (max_frames << 32) // self.step + 1
+        # src[0] holds the last sample of the previous block
+        # Samples are widened to int64 so (b - a) * frac can't overflow
+        self.src = np.zeros(max_frames + 1, dtype=np.int64)
+        self.ramp = np.arange(max_out, dtype=np.int64) * self.step
+        self.ipos = np.empty(max_out, dtype=np.int64)
+        self.idx = np.empty(max_out, dtype=np.int64)
+        self.a = np.empty(max_out, dtype=np.int64)
+        self.b = np.empty(max_out, dtype=np.int64)
+
+    def process(self, mono, out):
+        """Resample one block of at most max_frames samples into out.
+        Returns the number of samples written."""
+        n = len(mono)
+        src = self.src
+        src[1:n + 1] = mono
+
+        # Emit every output position that still has a right-hand neighbour
+        end = n << 32
+        n_out = (end - self.pos - 1) // self.step + 1 if self.pos < end else 0
+        ipos, idx = self.ipos[:n_out], self.idx[:n_out]
+        a, b = self.a[:n_out], self.b[:n_out]
+
+        np.add(self.ramp[:n_out], self.pos, out=ipos)
+        np.right_shift(ipos, 32, out=idx)
+        frac = np.bitwise_and(ipos, 0xFFFFFFFF, out=ipos)
+        np.take(src, idx, out=a, mode="clip")
+        np.add(idx, 1, out=idx)
+        np.take(src, idx, out=b, mode="clip")
+        # out = a + (((b - a) * frac) >> 32), which always lies between a and b
+        np.subtract(b, a, out=b)
+        np.multiply(b, frac, out=b)
+        np.right_shift(b, 32, out=b)
+        np.add(a, b, out=out[:n_out], casting="unsafe")
+
+        self.pos += n_out * self.step - end
+        src[0] = src[n]
+        return n_out
 
 
 def audio_callback(indata, frames, time_info, status):
-    mono = indata[:, 0].copy()
-    if capture_rate != WHISPER_RATE:
-        ratio = WHISPER_RATE / capture_rate
-        n_out = int(len(mono) * ratio)
-        indices = np.minimum(
-            (np.arange(n_out) / ratio).astype(int), len(mono) - 1
-        )
-        mono = mono[indices]
-    audio_queue.put(mono)
+    slab = audio_ring.claim()
+    if slab is None:
+        return  # writer fell behind; counted in audio_ring.dropped
+    mono = indata[:, 0]
+    if resampler is None:
+        n = len(mono)
+        slab[:n] = mono
+    else:
+        n = resampler.process(mono, slab)
+    audio_ring.commit(n)
 
 
 def find_input_device(bt_device_name=None):
@@ -72,122 +273,35 @@ def find_input_device(bt_device_name=None):
     raise RuntimeError("No input devices found. Is a microphone connected?")
 
 
-# =========================
-# Bluetooth codec management
-# =========================
-
-
-def get_bt_card():
-    """Find the active Bluetooth audio card, its current profile, and device description.
-    Returns (card_name, active_profile, device_description) or (None, None, None)."""
-    try:
-        result = subprocess.run(
-            ["pactl", "list", "cards"], capture_output=True, text=True, timeout=5
-        )
-    except (FileNotFoundError, subprocess.TimeoutExpired):
-        return None, None, None
-
-    card_name = None
-    active_profile = None
-    device_desc = None
-    in_bluez_card = False
-
-    for line in result.stdout.split("\n"):
-        stripped = line.strip()
-        if stripped.startswith("Name:") and "bluez" in stripped.lower():
-            card_name = stripped.split("Name:", 1)[1].strip()
-            in_bluez_card = True
-        elif stripped.startswith("Name:"):
-            in_bluez_card = False
-        elif in_bluez_card and stripped.startswith("device.description ="):
-            # e.g. device.description = "WH-1000XM5"
-            device_desc = stripped.split("=", 1)[1].strip().strip('"')
-        elif in_bluez_card and stripped.startswith("Active Profile:"):
-            active_profile = stripped.split("Active Profile:", 1)[1].strip()
-            break
-
-    return card_name, active_profile, device_desc
-
-
-def find_hfp_profile(card_name):
-    """Find an HFP profile (mSBC preferred) for mic input."""
-    try:
-        result = subprocess.run(
-            ["pactl", "list", "cards"], capture_output=True, text=True, timeout=5
-        )
-    except (FileNotFoundError, subprocess.TimeoutExpired):
-        return None
-
-    in_card = False
-    in_profiles = False
-    profiles = []  # list of (profile_name, full_description_line)
-
-    for line in result.stdout.split("\n"):
-        stripped = line.strip()
-        if stripped.startswith("Name:") and card_name in stripped:
-            in_card = True
-        elif stripped.startswith("Name:"):
-            in_card = False
-        elif in_card and stripped.startswith("Profiles:"):
-            in_profiles = True
-        elif in_card and in_profiles:
-            # Profile lines contain "(sinks: N, sources: N, ...)"
-            if "sinks:" in stripped and ":" in stripped:
-                profile = stripped.split(":")[0].strip()
-                profiles.append((profile, stripped))
-            else:
-                in_profiles = False
-
-    # Prefer mSBC over CVSD — check full description line for codec name
-    for p, desc in profiles:
-        if "headset" in p.lower() and "msbc" in desc.lower():
-            return p
-    for p, desc in profiles:
-        if "headset" in p.lower():
-            return p
-    return None
-
-
-def set_bt_profile(card_name, profile):
-    """Switch Bluetooth card to a given profile."""
-    if not card_name or not profile:
-        return
-    try:
-        subprocess.run(
-            ["pactl", "set-card-profile", card_name, profile],
-            capture_output=True, timeout=5,
-        )
-    except (FileNotFoundError, subprocess.TimeoutExpired):
-        pass
-
-
-def set_wp_autoswitch(enabled):
-    """Enable or disable WirePlumber's BT auto-profile-switching."""
-    try:
-        subprocess.run(
-            ["wpctl", "settings", "bluetooth.autoswitch-to-headset-profile",
-             "true" if enabled else "false"],
-            capture_output=True, timeout=5,
-        )
-    except (FileNotFoundError, subprocess.TimeoutExpired):
-        pass
-
-
 # =========================
 # Helpers
 # =========================
 
 
 FONT_SIZE_PT = 20  # Consistent font size in points for all text
+WINDOW_WIDTH = 1200
+TEXT_MARGIN_X = 32
+TEXT_MARGIN_Y = 28
+
 
+_attr_cache = {}  # (size_pt, color_hex) -> Pango.AttrList
 
-def _set_label_font(label, size_pt, color_hex="#cdd6f4"):
-    """Set font size and color on a GtkLabel using Pango attributes."""
-    attrs = Pango.AttrList()
-    attrs.insert(Pango.attr_size_new(size_pt * Pango.SCALE))
-    r, g, b = int(color_hex[1:3], 16), int(color_hex[3:5], 16), int(color_hex[5:7], 16)
-    attrs.insert(Pango.attr_foreground_new(r * 257, g * 257, b * 257))
-    label.set_attributes(attrs)
+
+def _text_attrs(size_pt, color_hex="#cdd6f4"):
+    """Pango attributes for a font size and color. Attribute lists are built
+    once per style and shared between layouts."""
+    key = (size_pt, color_hex)
+    attrs = _attr_cache.get(key)
+    if attrs is None:
+        rgba = Gdk.RGBA()
+        rgba.parse(color_hex)
+        attrs = Pango.AttrList()
+        attrs.insert(Pango.attr_size_new(size_pt * Pango.SCALE))
+        attrs.insert(Pango.attr_foreground_new(
+            round(rgba.red * 65535), round(rgba.green * 65535), round(rgba.blue * 65535)
+        ))
+        _attr_cache[key] = attrs
+    return attrs
 
 
 # =========================
@@ -199,7 +313,8 @@ class DictationWindow(Gtk.Window):
     def __init__(self):
         super().__init__(title="Dictation")
         self.set_decorated(False)
-        self.set_default_size(1200, -1)
+        self.set_default_size(WINDOW_WIDTH, -1)
+        self.set_resizable(False)
         self.set_position(Gtk.WindowPosition.CENTER)
 
         # Screen-level CSS for window background and border
@@ -214,14 +329,25 @@ class DictationWindow(Gtk.Window):
             Gdk.Screen.get_default(), css, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION
         )
 
-        # Layout: just the status label
-        self.timer_label = Gtk.Label(label="Starting...")
-        _set_label_font(self.timer_label, FONT_SIZE_PT)
-        self.timer_label.set_margin_top(28)
-        self.timer_label.set_margin_start(32)
-        self.timer_label.set_margin_end(32)
-        self.timer_label.set_margin_bottom(28)
-        self.add(self.timer_label)
+        # Layout: just the status text, drawn with Cairo from one long-lived
+        # Pango layout. The area has a fixed size and the text is ellipsized,
+        # so a text change never triggers a size negotiation, only a repaint.
+        text_width = WINDOW_WIDTH - 2 * TEXT_MARGIN_X
+        self.status_text = "Starting..."
+        self.status_area = Gtk.DrawingArea()
+        self.status_layout = self.status_area.create_pango_layout(self.status_text)
+        self.status_layout.set_attributes(_text_attrs(FONT_SIZE_PT))
+        self.status_layout.set_width(text_width * Pango.SCALE)
+        self.status_layout.set_ellipsize(Pango.EllipsizeMode.END)
+        self.status_layout.set_alignment(Pango.Alignment.CENTER)
+        _, text_height = self.status_layout.get_pixel_size()
+        self.status_area.set_size_request(text_width, text_height)
+        self.status_area.set_margin_top(TEXT_MARGIN_Y)
+        self.status_area.set_margin_start(TEXT_MARGIN_X)
+        self.status_area.set_margin_end(TEXT_MARGIN_X)
+        self.status_area.set_margin_bottom(TEXT_MARGIN_Y)
+        self.status_area.connect("draw", self.on_draw_status)
+        self.add(self.status_area)
 
         self.connect("key-press-event", self.on_key_press)
         self.connect("destroy", Gtk.main_quit)
@@ -233,31 +359,37 @@ class DictationWindow(Gtk.Window):
         self.stream = None
         self.stop_event = threading.Event()
         self.sock = None
+        self.shm = None  # ShmAudioRing, if the daemon accepted one
+        self.daemon_conn = None  # Gio.SocketConnection for reading daemon messages
+        self.daemon_lines = None  # Gio.DataInputStream over daemon_conn
+        self.read_cancellable = Gio.Cancellable()
         self.final_text = ""
-        self.bt_card = None
-        self.bt_original_profile = None
-        self.wp_autoswitch_disabled = False
+        self.selections = None  # SelectionServer to keep serving after exit
 
         # Start audio capture in a worker thread
         threading.Thread(target=self.worker_init, daemon=True).start()
 
     def worker_init(self):
-        global capture_rate
-
-        # Switch Bluetooth to HFP (mSBC) for headset mic access.
-        # Disable WirePlumber autoswitch to prevent it from fighting our
-        # manual profile change (it has a 2s timeout that restores A2DP).
-        bt_device_name = None
-        self.bt_card, self.bt_original_profile, bt_desc = get_bt_card()
-        if self.bt_card:
-            hfp = find_hfp_profile(self.bt_card)
-            if hfp:
-                bt_device_name = bt_desc
-                set_wp_autoswitch(False)
-                self.wp_autoswitch_disabled = True
-                if self.bt_original_profile and hfp != self.bt_original_profile:
-                    set_bt_profile(self.bt_card, hfp)
-                    time.sleep(0.5)  # let PipeWire settle after profile switch
+        global capture_rate, resampler, audio_ring
+
+        # Connect to daemon. It switches a Bluetooth headset to HFP for mic
+        # access before greeting us with the device to record from.
+        try:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCK_SNDBUF)
+            self.sock.connect(SOCKET_PATH)
+            self.sock.settimeout(HELLO_TIMEOUT_S)
+            bt_device_name = self.read_hello()
+            # Must stay a timeout, never blocking: the Gio reader's dup of
+            # this fd is non-blocking, and with a timeout CPython polls for
+            # writability itself instead of failing with BlockingIOError
+            self.sock.settimeout(SEND_TIMEOUT_S)
+        except (ConnectionRefusedError, FileNotFoundError):
+            GLib.idle_add(self.show_error, "Daemon not running")
+            return
+        except OSError as e:
+            GLib.idle_add(self.show_error, f"Daemon error: {e}")
+            return
 
         try:
             device = find_input_device(bt_device_name=bt_device_name)
@@ -268,13 +400,17 @@ class DictationWindow(Gtk.Window):
         dev_info = sd.query_devices(device)
         capture_rate = int(dev_info["default_samplerate"])
         block_size = int(capture_rate * BLOCK_MS / 1000)
+        if capture_rate != WHISPER_RATE:
+            resampler = LinearResampler(capture_rate, WHISPER_RATE, block_size)
+        # Resampled blocks can be longer than the input when capturing below 16kHz
+        audio_ring = SPSCRing(block_size * max(capture_rate, WHISPER_RATE) // capture_rate + 2)
 
         try:
             self.stream = sd.InputStream(
                 device=device,
                 samplerate=capture_rate,
                 channels=CHANNELS,
-                dtype=np.float32,
+                dtype=np.int16,
                 blocksize=block_size,
                 callback=audio_callback,
             )
@@ -283,42 +419,68 @@ class DictationWindow(Gtk.Window):
             GLib.idle_add(self.show_error, f"Audio error: {e}")
             return
 
-        # Connect to daemon
+        # Prefer handing the daemon a shared-memory ring for the audio; if
+        # that isn't possible, stream it over the socket instead
         try:
-            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-            self.sock.connect(SOCKET_PATH)
-        except (ConnectionRefusedError, FileNotFoundError):
-            GLib.idle_add(self.show_error, "Daemon not running")
-            return
-
-        # Start reader thread to receive messages from daemon
-        threading.Thread(target=self.read_daemon_messages, daemon=True).start()
+            self.shm = ShmAudioRing()
+            self.shm.attach(self.sock)
+        except OSError:
+            self.shm = None
 
-        # Signal the GUI to start recording
+        # Signal the GUI to start recording (and reading daemon messages)
         GLib.idle_add(self.start_recording)
 
         # Writer loop: stream audio to daemon
         self.stream_audio_to_daemon()
 
+    def read_hello(self):
+        """Read the daemon's H line, consuming nothing after it. Returns the
+        Bluetooth input device name, or None to use the default device."""
+        line = b""
+        while not line.endswith(b"\n"):
+            peek = self.sock.recv(RECV_BUF_SIZE, socket.MSG_PEEK)
+            if not peek:
+                raise ConnectionResetError("daemon closed the connection")
+            idx = peek.find(b"\n")
+            line += self.sock.recv(idx + 1 if idx >= 0 else len(peek))
+        line = line[:-1].decode("utf-8", errors="replace")
+        if not line.startswith("H "):
+            return None
+        return line[2:] or None
+
     def stream_audio_to_daemon(self):
-        """Send audio chunks to daemon until stop_event is set."""
-        while not self.stop_event.is_set():
-            try:
-                chunk = audio_queue.get(timeout=0.1)
-            except queue.Empty:
+        """Send audio chunks to daemon until stop_event is set and the ring
+        is drained."""
+        while True:
+            # Sample stop_event before the ring: the stream is stopped before
+            # stop_event is set, so once it's seen nothing new can arrive.
+            stopping = self.stop_event.is_set()
+            batch = audio_ring.peek(SEND_BATCH)
+            if not batch:
+                if stopping:
+                    break
+                audio_ring.wait()
                 continue
+            # Zero-copy views over the slabs, gathered into one write
+            bufs = [memoryview(slab)[:n].cast("B") for slab, n in batch]
             try:
-                self.sock.sendall(chunk.tobytes())
-            except (BrokenPipeError, ConnectionResetError, OSError):
-                return
-
-        # Drain remaining audio from queue
-        while not audio_queue.empty():
-            try:
-                chunk = audio_queue.get_nowait()
-                self.sock.sendall(chunk.tobytes())
-            except (queue.Empty, BrokenPipeError, ConnectionResetError, OSError):
+                if self.shm:
+                    self.shm.write(bufs)
+                else:
+                    sendmsg_all(self.sock, bufs)
+            except (BrokenPipeError, ConnectionResetError, OSError) as e:
+                # Still end the stream below so the daemon transcribes what
+                # it has instead of waiting for EOF
+                if not self.cancelled:
+                    print(f"Audio send failed: {e}", file=sys.stderr, flush=True)
                 break
+            audio_ring.pop(len(batch))
+
+        if self.shm:
+            self.shm.close()  # the daemon keeps its own mapping
+        if audio_ring.dropped:
+            print(f"Dropped {audio_ring.dropped} audio blocks (writer fell behind)",
+                  file=sys.stderr, flush=True)
 
         # Signal end of audio
         try:
@@ -327,54 +489,85 @@ class DictationWindow(Gtk.Window):
             pass
 
     def read_daemon_messages(self):
-        """Read newline-delimited messages from daemon."""
-        buf = b""
+        """Start reading newline-delimited messages from the daemon on the GTK
+        main loop. Uses its own dup of the socket so the writer thread can
+        keep using self.sock."""
+        gsock = Gio.Socket.new_from_fd(os.dup(self.sock.fileno()))
+        self.daemon_conn = Gio.SocketConnection.factory_create_connection(gsock)
+        self.daemon_lines = Gio.DataInputStream.new(self.daemon_conn.get_input_stream())
+        self._read_next_line()
+
+    def _read_next_line(self):
+        self.daemon_lines.read_line_async(
+            GLib.PRIORITY_DEFAULT, self.read_cancellable, self._on_daemon_line
+        )
+
+    def _on_daemon_line(self, stream, result):
         try:
-            while True:
-                data = self.sock.recv(4096)
-                if not data:
-                    break
-                buf += data
-                while b"\n" in buf:
-                    line, buf = buf.split(b"\n", 1)
-                    self.handle_daemon_line(line.decode("utf-8", errors="replace"))
-        except (ConnectionResetError, BrokenPipeError, OSError):
-            pass
-        finally:
+            line, _ = stream.read_line_finish(result)
+        except GLib.Error:
+            line = None  # connection reset, or cancelled
+        if not line:  # EOF; the daemon never sends empty lines
             if not self.cancelled:
-                GLib.idle_add(self.finish, self.final_text)
+                self.finish(self.final_text)
+            return
+        self.handle_daemon_line(line.decode("utf-8", errors="replace"))
+        self._read_next_line()
 
     def handle_daemon_line(self, line):
-        """Parse an F or L line from the daemon."""
+        """Parse an F, S or L line from the daemon."""
         if line.startswith("F "):
             self.final_text = line[2:]
+        elif line.startswith("S "):
+            self._set_status(line[2:])
         elif line.startswith("L "):
             try:
                 dur = float(line[2:])
-                GLib.idle_add(self.timer_label.set_text,
-                              f"Transcribing {dur:.1f}s...")
+                self._set_status(f"Transcribing {dur:.1f}s...")
             except ValueError:
                 pass
 
     def show_error(self, message):
-        self.timer_label.set_text(message)
+        self._set_status(message)
         GLib.timeout_add(3000, Gtk.main_quit)
         return False
 
     def start_recording(self):
+        if self.cancelled:  # Ctrl+C while still connecting; sock is closed
+            return False
         self.recording = True
         self.record_start = time.time()
         self.update_timer()
-        self.timer_id = GLib.timeout_add(500, self.update_timer)
+        self.read_daemon_messages()
         return False
 
     def update_timer(self):
         if not self.recording:
+            self.timer_id = None
             return False
         elapsed = time.time() - self.record_start
         mins, secs = divmod(int(elapsed), 60)
-        self.timer_label.set_text(f"Recording...  {mins:02d}:{secs:02d}")
-        return True
+        self._set_status(f"Recording...  {mins:02d}:{secs:02d}")
+        # The display only changes once per second: re-arm for just past the
+        # next whole second of elapsed time instead of polling.
+        delay_ms = int((1 - elapsed % 1) * 1000) + 1
+        self.timer_id = GLib.timeout_add(delay_ms, self.update_timer)
+        return False
+
+    def _set_status(self, text):
+        """Change the status text. Main thread only. Only queues a repaint
+        of the drawing area's own rectangle, and GTK's frame clock coalesces
+        repaints, so a burst of updates costs at most one redraw per frame."""
+        if text != self.status_text:
+            self.status_text = text
+            self.status_area.queue_draw()
+
+    def on_draw_status(self, widget, cr):
+        # The layout is only reshaped here, once per repaint
+        if self.status_layout.get_text() != self.status_text:
+            self.status_layout.set_text(self.status_text, -1)
+        PangoCairo.show_layout(cr, self.status_layout)
+        return False
 
     def on_key_press(self, widget, event):
         if event.keyval == Gdk.KEY_Escape:
@@ -389,7 +582,7 @@ class DictationWindow(Gtk.Window):
         if not self.recording:
             return
         self.recording = False
-        self.timer_label.set_text("Transcribing...")
+        self._set_status("Transcribing...")
 
         # Stop audio capture
         if self.stream:
@@ -397,6 +590,7 @@ class DictationWindow(Gtk.Window):
 
         # Signal writer thread to drain and shut down
         self.stop_event.set()
+        audio_ring.wake()
 
     def cancel(self):
         """Cancel — close everything without pasting."""
@@ -406,24 +600,27 @@ class DictationWindow(Gtk.Window):
             GLib.source_remove(self.timer_id)
             self.timer_id = None
         self.stop_event.set()
+        if audio_ring is not None:
+            audio_ring.wake()
         if self.stream:
             self.stream.close()
             self.stream = None
+        self._close_daemon_connection()
+        Gtk.main_quit()
+
+    def _close_daemon_connection(self):
+        self.read_cancellable.cancel()
+        if self.daemon_conn:
+            try:
+                self.daemon_conn.close(None)
+            except GLib.Error:
+                pass
+            self.daemon_conn = None
         if self.sock:
             try:
                 self.sock.close()
             except OSError:
                 pass
-        self._restore_bt_profile()
-        Gtk.main_quit()
-
-    def _restore_bt_profile(self):
-        """Restore the original Bluetooth profile and re-enable WirePlumber autoswitch."""
-        if self.bt_card and self.bt_original_profile:
-            set_bt_profile(self.bt_card, self.bt_original_profile)
-        if self.wp_autoswitch_disabled:
-            set_wp_autoswitch(True)
-            self.wp_autoswitch_disabled = False
 
     def finish(self, text):
         if self.cancelled:
@@ -432,60 +629,141 @@ class DictationWindow(Gtk.Window):
         if self.stream:
             self.stream.close()
             self.stream = None
-        if self.sock:
-            try:
-                self.sock.close()
-            except OSError:
-                pass
-
-        self._restore_bt_profile()
+        self._close_daemon_connection()
 
         if text:
-            pyperclip.copy(text)
+            # CLIPBOARD for Ctrl+V, PRIMARY so xterm's Shift+Insert works
+            self.selections = SelectionServer(text)
+            self.selections.own("CLIPBOARD")
+            self.selections.own("PRIMARY")
         Gtk.main_quit()
 
-        # Refocus the previous window and paste
+        # Refocus the previous window and paste. Hide first: main() keeps the
+        # process alive afterwards to serve the selections.
+        self.hide()
+        Gdk.Display.get_default().flush()
         if text and getattr(self, "prev_window", None):
-            paste_to_window(self.prev_window, text)
+            paste_to_window(self.prev_window)
 
         return False
 
 
+# =========================
+# X11 window focus, paste, and selections
+# =========================
+
+_display = xdisplay.Display()
+_NET_ACTIVE_WINDOW = _display.intern_atom("_NET_ACTIVE_WINDOW")
+_TARGETS = _display.intern_atom("TARGETS")
+_UTF8_STRING = _display.intern_atom("UTF8_STRING")
+_TEXT = _display.intern_atom("TEXT")
+
+
 def get_active_window_id():
     """Get the currently focused window ID before our popup appears."""
-    try:
-        result = subprocess.run(
-            ["xdotool", "getactivewindow"], capture_output=True, text=True
-        )
-        return result.stdout.strip() if result.returncode == 0 else None
-    except FileNotFoundError:
+    prop = _display.screen().root.get_full_property(_NET_ACTIVE_WINDOW, X.AnyPropertyType)
+    if prop is None or not prop.value or not prop.value[0]:
         return None
+    return prop.value[0]
 
 
 def get_window_class(window_id):
     """Get the WM_CLASS of a window."""
     try:
-        result = subprocess.run(
-            ["xdotool", "getwindowclassname", window_id],
-            capture_output=True, text=True,
-        )
-        return result.stdout.strip() if result.returncode == 0 else ""
-    except FileNotFoundError:
+        wm_class = _display.create_resource_object("window", window_id).get_wm_class()
+    except xerror.XError:
         return ""
+    return wm_class[1] if wm_class else ""
+
+
+def activate_window(window_id):
+    """Ask the window manager to focus a window (EWMH _NET_ACTIVE_WINDOW) and
+    wait until it has, like `xdotool windowactivate --sync`."""
+    window = _display.create_resource_object("window", window_id)
+    event = protocol.event.ClientMessage(
+        window=window, client_type=_NET_ACTIVE_WINDOW,
+        data=(32, [2, X.CurrentTime, 0, 0, 0]),  # 2 = request from a pager
+    )
+    _display.screen().root.send_event(
+        event, event_mask=X.SubstructureRedirectMask | X.SubstructureNotifyMask
+    )
+    _display.flush()
+    deadline = time.monotonic() + ACTIVATE_TIMEOUT_S
+    while get_active_window_id() != window_id and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def send_key(modifier, key):
+    """Synthesize a modifier+key press via XTEST, e.g. ("Control_L", "v")."""
+    mod = _display.keysym_to_keycode(XK.string_to_keysym(modifier))
+    code = _display.keysym_to_keycode(XK.string_to_keysym(key))
+    xtest.fake_input(_display, X.KeyPress, mod)
+    xtest.fake_input(_display, X.KeyPress, code)
+    xtest.fake_input(_display, X.KeyRelease, code)
+    xtest.fake_input(_display, X.KeyRelease, mod)
+    _display.sync()
+
+
+class SelectionServer:
+    """Owns X selections holding the transcript and answers paste requests
+    for them, which is what xclip does in the background.
+
+    X selections live only as long as their owner, so after the popup closes
+    main() calls serve(), which keeps the process running until every owned
+    selection has been taken over by another client."""
+
+    def __init__(self, text):
+        self.text = text
+        self.window = _display.screen().root.create_window(0, 0, 1, 1, 0, X.CopyFromParent)
+        self.owned = set()
+
+    def own(self, name):
+        """Take ownership of a selection, e.g. "PRIMARY"."""
+        atom = _display.intern_atom(name)
+        self.window.set_selection_owner(atom, X.CurrentTime)
+        if _display.get_selection_owner(atom) == self.window:
+            self.owned.add(atom)
+
+    def serve(self):
+        """Answer selection requests until no selection is owned anymore."""
+        while self.owned:
+            event = _display.next_event()
+            if event.type == X.SelectionRequest:
+                self._answer(event)
+            elif event.type == X.SelectionClear:
+                self.owned.discard(event.atom)
+
+    def _answer(self, req):
+        # Obsolete clients pass no property; reply in the target instead
+        prop = req.property if req.property != X.NONE else req.target
+        if req.target == _TARGETS:
+            req.requestor.change_property(
+                prop, Xatom.ATOM, 32, [_TARGETS, _UTF8_STRING, _TEXT, Xatom.STRING]
+            )
+        elif req.target in (_UTF8_STRING, _TEXT):
+            req.requestor.change_property(prop, _UTF8_STRING, 8, self.text.encode("utf-8"))
+        elif req.target == Xatom.STRING:
+            req.requestor.change_property(
+                prop, Xatom.STRING, 8, self.text.encode("latin-1", errors="replace")
+            )
+        else:
+            prop = X.NONE  # unsupported target: refuse
+        req.requestor.send_event(protocol.event.SelectionNotify(
+            time=req.time, requestor=req.requestor, selection=req.selection,
+            target=req.target, property=prop,
+        ))
+        _display.flush()
 
 
-def paste_to_window(window_id, text):
+def paste_to_window(window_id):
     """Refocus the previous window and paste using the appropriate method."""
-    # Also copy to PRIMARY selection so xterm's Shift+Insert works
-    subprocess.run(["xclip", "-selection", "primary"], input=text.encode())
-
-    subprocess.run(["xdotool", "windowactivate", "--sync", window_id])
+    activate_window(window_id)
 
     wm_class = get_window_class(window_id)
     if wm_class.lower() in ("xterm", "uxterm"):
-        subprocess.run(["xdotool", "key", "--clearmodifiers", "shift+Insert"])
+        send_key("Shift_L", "Insert")
     else:
-        subprocess.run(["xdotool", "key", "--clearmodifiers", "ctrl+v"])
+        send_key("Control_L", "v")
 
 
 def main():
@@ -494,6 +772,8 @@ def main():
     win.prev_window = prev_window
     win.show_all()
     Gtk.main()
+    if win.selections:
+        win.selections.serve()
 
 
 if __name__ == "__main__":
@@ -6,9 +6,17 @@ One-shot transcription: collects all audio until the client signals done,
 then transcribes the full recording and sends the result back.
 """
 
+import fcntl
+import json
+import mmap
 import os
+import select
+import shutil
 import socket
+import struct
+import subprocess
 import sys
+import threading
 import time
 import numpy as np
 from faster_whisper import WhisperModel
@@ -20,7 +28,28 @@ from faster_whisper import WhisperModel
 WHISPER_RATE = 16000
 LANGUAGE = None  # auto-detect (supports en, de, hu, etc.)
 MODEL_SIZE = "large-v3-turbo"
+CPU_THREADS = os.cpu_count() or 0  # 0 lets CTranslate2 choose
+# Greedy decoding without temperature fallback or cross-segment
+# conditioning: lowest latency, and avoids repetition loops on long clips
+DECODE_OPTIONS = dict(
+    beam_size=1,
+    best_of=1,
+    temperature=0.0,
+    condition_on_previous_text=False,
+)
 SOCKET_PATH = os.path.join(os.environ.get("XDG_RUNTIME_DIR", "/tmp"), "dictation.sock")
+RECV_CHUNK = 65536
+RECV_CAPACITY = 1 << 20  # initial receive buffer, ~32s of int16 audio
+# Shared-memory audio ring (layout shared with dictation_gui.py): a header
+# holding write_pos at offset 0 and read_pos at offset 8, both running byte
+# totals, followed by the ring data
+SHM_HEADER = 64
+SHM_HELLO = b"M"  # first byte from a client that attaches a ring memfd
+SHM_SEALS = fcntl.F_SEAL_SHRINK | fcntl.F_SEAL_GROW  # required, so the size is fixed
+SHM_POLL_S = 0.05
+BT_READY_TIMEOUT_S = 0.5  # max wait for the BT mic after a profile switch
+BT_READY_POLL_S = 0.025
+BT_WATCH_RETRY_S = 2.0  # delay before restarting `pactl subscribe` after it exits
 LOG_DIR = os.path.join(os.environ.get("XDG_DATA_HOME", os.path.expanduser("~/.local/share")), "dictation")
 LOG_PATH = os.path.join(LOG_DIR, "timing.csv")
 
@@ -35,13 +64,342 @@ def log_timing(audio_duration, transcribe_duration):
         f.write(f"{audio_duration:.2f},{transcribe_duration:.2f}\n")
 
 
+# =========================
+# Bluetooth codec management
+# =========================
+
+
+_HAVE_PACTL = shutil.which("pactl") is not None
+_pactl_json = True  # cleared once pactl turns out not to support --format=json
+
+
+def _run_pactl_list_cards(*flags):
+    return subprocess.run(
+        ["pactl", *flags, "list", "cards"], capture_output=True, text=True, timeout=5
+    )
+
+
+def _pactl_list_cards():
+    """List audio cards via pactl. Returns a list of card dicts parsed from
+    `pactl --format=json`, the plain-text listing if this pactl predates JSON
+    output, or None if pactl is unavailable."""
+    global _pactl_json
+    if not _HAVE_PACTL:
+        return None
+    try:
+        if _pactl_json:
+            result = _run_pactl_list_cards("--format=json")
+            if result.returncode == 0:
+                try:
+                    return json.loads(result.stdout)
+                except ValueError:
+                    pass
+            elif "unrecognized option" in result.stderr:
+                _pactl_json = False
+        result = _run_pactl_list_cards()
+        if result.returncode != 0:
+            return None  # e.g. pipewire-pulse not up yet; keep trying JSON
+        # JSON failed where plain text works: this pactl has no JSON output
+        _pactl_json = False
+        return result.stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+
+def get_bt_card(cards=None):
+    """Find the active Bluetooth audio card, its current profile, and device description.
+    Returns (card_name, active_profile, device_description) or (None, None, None).
+    Pass cards from _pactl_list_cards() to reuse an earlier listing."""
+    if cards is None:
+        cards = _pactl_list_cards()
+        if cards is None:
+            return None, None, None
+    if isinstance(cards, str):
+        return _bt_card_from_text(cards)
+
+    for card in cards:
+        if "bluez" in card.get("name", "").lower():
+            return (card["name"], card.get("active_profile"),
+                    card.get("properties", {}).get("device.description"))
+    return None, None, None
+
+
+def _bt_card_from_text(stdout):
+    """get_bt_card() for the plain-text `pactl list cards` format."""
+    card_name = None
+    active_profile = None
+    device_desc = None
+    in_bluez_card = False
+
+    for line in stdout.split("\n"):
+        stripped = line.strip()
+        if stripped.startswith("Name:") and "bluez" in stripped.lower():
+            card_name = stripped.split("Name:", 1)[1].strip()
+            in_bluez_card = True
+        elif stripped.startswith("Name:"):
+            in_bluez_card = False
+        elif in_bluez_card and stripped.startswith("device.description ="):
+            # e.g. device.description = "WH-1000XM5"
+            device_desc = stripped.split("=", 1)[1].strip().strip('"')
+        elif in_bluez_card and stripped.startswith("Active Profile:"):
+            active_profile = stripped.split("Active Profile:", 1)[1].strip()
+            break
+
+    return card_name, active_profile, device_desc
+
+
+def find_hfp_profile(card_name, cards=None):
+    """Find an HFP profile (mSBC preferred) for mic input.
+    Pass cards from _pactl_list_cards() to reuse an earlier listing."""
+    if cards is None:
+        cards = _pactl_list_cards()
+        if cards is None:
+            return None
+
+    if isinstance(cards, str):
+        profiles = _card_profiles_from_text(cards, card_name)
+    else:
+        profiles = []  # list of (profile_name, description)
+        for card in cards:
+            if card.get("name") == card_name:
+                profiles = [(p, info.get("description", ""))
+                            for p, info in card.get("profiles", {}).items()]
+                break
+
+    # Prefer mSBC over CVSD — check the description for the codec name
+    for p, desc in profiles:
+        if "headset" in p.lower() and "msbc" in desc.lower():
+            return p
+    for p, desc in profiles:
+        if "headset" in p.lower():
+            return p
+    return None
+
+
+def _card_profiles_from_text(stdout, card_name):
+    """List (profile_name, full_description_line) for a card in the
+    plain-text `pactl list cards` format."""
+    in_card = False
+    in_profiles = False
+    profiles = []
+
+    for line in stdout.split("\n"):
+        stripped = line.strip()
+        if stripped.startswith("Name:") and card_name in stripped:
+            in_card = True
+        elif stripped.startswith("Name:"):
+            in_card = False
+        elif in_card and stripped.startswith("Profiles:"):
+            in_profiles = True
+        elif in_card and in_profiles:
+            # Profile lines contain "(sinks: N, sources: N, ...)"
+            if "sinks:" in stripped and ":" in stripped:
+                profile = stripped.split(":")[0].strip()
+                profiles.append((profile, stripped))
+            else:
+                in_profiles = False
+
+    return profiles
+
+
+def set_bt_profile(card_name, profile):
+    """Switch Bluetooth card to a given profile."""
+    if not card_name or not profile:
+        return
+    try:
+        subprocess.run(
+            ["pactl", "set-card-profile", card_name, profile],
+            capture_output=True, timeout=5,
+        )
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        pass
+
+
+def _bt_source_present(address):
+    """Check whether a Bluetooth input source for a device address exists."""
+    try:
+        result = subprocess.run(
+            ["pactl", "list", "short", "sources"], capture_output=True, text=True, timeout=5
+        )
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        return False
+    for line in result.stdout.split("\n"):
+        # e.g. "83\tbluez_input.AA_BB_CC_DD_EE_FF.0\tPipeWire\ts16le 1ch 16000Hz\tSUSPENDED"
+        fields = line.split("\t")
+        if len(fields) > 1 and fields[1].startswith(("bluez_input.", "bluez_source.")):
+            if address in fields[1].replace(":", "_"):
+                return True
+    return False
+
+
+def wait_for_bt_source(card_name, timeout=BT_READY_TIMEOUT_S):
+    """After switching a card to HFP, wait until its input source shows up.
+    Returns True once it has, False if it didn't within timeout."""
+    # bluez_card.AA_BB_CC_DD_EE_FF -> AA_BB_CC_DD_EE_FF
+    address = card_name.split(".", 1)[-1].replace(":", "_")
+    deadline = time.monotonic() + timeout
+    while not _bt_source_present(address):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(BT_READY_POLL_S)
+    return True
+
+
+def set_wp_autoswitch(enabled):
+    """Enable or disable WirePlumber's BT auto-profile-switching."""
+    try:
+        subprocess.run(
+            ["wpctl", "settings", "bluetooth.autoswitch-to-headset-profile",
+             "true" if enabled else "false"],
+            capture_output=True, timeout=5,
+        )
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        pass
+
+
+def _detect_bt():
+    """Look up the Bluetooth headset and its HFP profile with one pactl call.
+    Returns (card, active_profile, description, hfp_profile), all None if
+    there's no headset or the lookup failed."""
+    try:
+        cards = _pactl_list_cards()
+        card, active, desc = get_bt_card(cards) if cards is not None else (None, None, None)
+        hfp = find_hfp_profile(card, cards) if card else None
+    except Exception as e:  # e.g. a pactl JSON shape we don't know
+        print(f"Bluetooth lookup failed: {e}", file=sys.stderr, flush=True)
+        return None, None, None, None
+    return card, active, desc, hfp
+
+
+# Cached headset lookup, refreshed by watch_bt_cards() whenever a card is
+# added, removed or changed, so accepting a client doesn't wait for pactl.
+# _bt_lock orders refreshes against our own profile switches.
+_bt_lock = threading.RLock()
+_bt_info = (None, None, None, None)  # (card, active_profile, description, hfp_profile)
+_bt_watching = False  # True while `pactl subscribe` is keeping _bt_info fresh
+
+
+def refresh_bt():
+    """Re-read the Bluetooth headset into the cache."""
+    global _bt_info
+    with _bt_lock:
+        _bt_info = _detect_bt()
+
+
+def watch_bt_cards():
+    """Refresh the headset cache on every pactl card event, for the lifetime
+    of the daemon. Restarts `pactl subscribe` if it exits (e.g. when
+    pipewire-pulse isn't up yet or restarts)."""
+    global _bt_watching
+    while True:
+        try:
+            proc = subprocess.Popen(
+                ["pactl", "subscribe"], stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL, text=True,
+            )
+        except OSError:
+            time.sleep(BT_WATCH_RETRY_S)
+            continue
+        refresh_bt()  # after subscribing, so later changes produce events
+        _bt_watching = True
+        for line in proc.stdout:
+            # e.g. "Event 'change' on card #52"
+            if " on card " in line:
+                refresh_bt()
+        _bt_watching = False
+        proc.wait()
+        time.sleep(BT_WATCH_RETRY_S)
+
+
+def start_bt_watcher():
+    if _HAVE_PACTL:
+        threading.Thread(target=watch_bt_cards, daemon=True).start()
+
+
+def prepare_bt():
+    """Switch the cached Bluetooth headset to HFP (mSBC) for mic access.
+    WirePlumber autoswitch is disabled first so it doesn't fight the manual
+    profile change (it has a 2s timeout that restores A2DP).
+    Returns (restore, device_description): restore is (card, profile) to pass
+    to restore_bt() afterwards, or None if there's no usable headset."""
+    with _bt_lock:
+        if not _bt_watching:  # no events to keep the cache fresh; look now
+            refresh_bt()
+        card, active, desc, hfp = _bt_info
+        if not card or not hfp:
+            return None, None
+        set_wp_autoswitch(False)
+        if active and hfp != active:
+            set_bt_profile(card, hfp)
+            wait_for_bt_source(card)  # let PipeWire settle
+    return (card, active), desc
+
+
+def restore_bt(card, profile):
+    """Restore the original Bluetooth profile and re-enable WirePlumber autoswitch."""
+    global _bt_info
+    with _bt_lock:
+        if profile:
+            set_bt_profile(card, profile)
+            # Don't let the next client see the HFP profile before the
+            # watcher has processed the card event
+            if _bt_info[0] == card:
+                _bt_info = (card, profile) + _bt_info[2:]
+        set_wp_autoswitch(True)
+
+
+# =========================
+# Transcription
+# =========================
+
+
+# Loaded in the background so clients can connect and record meanwhile
+_model = None
+_model_ready = threading.Event()
+_transcribe_lock = threading.Lock()  # one transcription at a time
+_record_lock = threading.Lock()  # one recording (and headset switch) at a time
+
+
 def load_model():
     print(f"Loading model '{MODEL_SIZE}'...", file=sys.stderr, flush=True)
-    model = WhisperModel(MODEL_SIZE, device="cpu", compute_type="int8")
+    model = WhisperModel(
+        MODEL_SIZE, device="cpu", compute_type="int8", cpu_threads=CPU_THREADS,
+    )
     print("Model loaded.", file=sys.stderr, flush=True)
     return model
 
 
+def warm_up(model):
+    """Run one throwaway transcription so CTranslate2 finishes lazy weight
+    loading and kernel selection before the first real request."""
+    print("Warming up model...", file=sys.stderr, flush=True)
+    t0 = time.monotonic()
+    segments, _ = model.transcribe(
+        np.zeros(WHISPER_RATE, dtype=np.float32),
+        language=LANGUAGE,
+        vad_filter=False,
+        **DECODE_OPTIONS,
+    )
+    for _ in segments:  # segments is lazy; decoding happens while iterating
+        pass
+    print(f"Warm-up done in {time.monotonic() - t0:.1f}s.", file=sys.stderr, flush=True)
+
+
+def load_in_background():
+    """Load and warm up the model, then let waiting transcriptions start. A
+    failure takes the whole daemon down, as it did when loading blocked
+    startup, so systemd restarts it."""
+    global _model
+    try:
+        model = load_model()
+        warm_up(model)
+    except Exception as e:
+        print(f"Failed to load model: {e}", file=sys.stderr, flush=True)
+        os._exit(1)
+    _model = model
+    _model_ready.set()
+
+
 def send_message(conn, msg_type, text):
     """Send a message to the client (newline-delimited)."""
     line = f"{msg_type} {text}\n"
@@ -51,26 +409,144 @@ def send_message(conn, msg_type, text):
         pass
 
 
-def handle_connection(conn, model):
-    """Read all audio until EOF, then transcribe and send the result."""
-    audio_buf = np.array([], dtype=np.float32)
-    byte_buf = b""
+class AudioBuffer:
+    """Growable receive buffer. Socket reads land directly in its free tail,
+    so receiving costs no per-recv allocation or copy."""
+
+    def __init__(self, capacity=RECV_CAPACITY):
+        self.data = bytearray(capacity)
+        self.size = 0  # bytes filled
+
+    def _reserve(self, n):
+        while len(self.data) - self.size < n:
+            self.data += bytes(len(self.data))  # double; amortized O(1)
+
+    def recv_from(self, conn):
+        """Receive once from conn into the buffer. Returns the byte count,
+        0 at EOF."""
+        self._reserve(RECV_CHUNK)
+        with memoryview(self.data)[self.size:] as free:
+            n = conn.recv_into(free)
+        self.size += n
+        return n
+
+    def extend(self, data):
+        """Append a bytes-like object."""
+        n = len(data)
+        self._reserve(n)
+        self.data[self.size:self.size + n] = data
+        self.size += n
+
+    def samples(self):
+        """Finish receiving and return the int16 PCM as float32 samples in
+        [-1, 1). Trims the buffer to whole samples in one step: the client
+        only sends whole samples, so a partial one can only be left by a
+        truncated stream."""
+        del self.data[(self.size // 2) * 2:]
+        pcm = np.frombuffer(self.data, dtype=np.int16)
+        return np.multiply(pcm, 1.0 / 32768.0, dtype=np.float32)
+
 
+def drain_shm(mm, read_pos, buf):
+    """Copy everything the client has published in the shared ring into buf.
+    Returns the new read position, which is also published to the client.
+    Raises ValueError if write_pos isn't within one ring of read_pos."""
+    write_pos = struct.unpack_from("Q", mm, 0)[0]
+    size = len(mm) - SHM_HEADER
+    if not 0 <= write_pos - read_pos <= size:
+        raise ValueError(f"write_pos {write_pos} out of range (read_pos {read_pos})")
+    with memoryview(mm) as mv:
+        while read_pos < write_pos:
+            off = read_pos % size
+            n = min(write_pos - read_pos, size - off)
+            buf.extend(mv[SHM_HEADER + off:SHM_HEADER + off + n])
+            read_pos += n
+    struct.pack_into("Q", mm, 8, read_pos)
+    return read_pos
+
+
+def receive_shm(conn, fd, buf):
+    """Collect audio from a client's shared-memory ring until the client
+    shuts down its end of the socket. A ring that isn't sealed against
+    resizing, or whose positions don't add up, ends the stream."""
+    try:
+        seals = fcntl.fcntl(fd, fcntl.F_GET_SEALS)
+        if seals & SHM_SEALS != SHM_SEALS or os.fstat(fd).st_size <= SHM_HEADER:
+            print("Rejected unsealed or undersized audio ring", file=sys.stderr, flush=True)
+            return
+        mm = mmap.mmap(fd, 0)
+    except OSError as e:
+        print(f"Rejected audio ring: {e}", file=sys.stderr, flush=True)
+        return
+    finally:
+        os.close(fd)
+    try:
+        read_pos = 0
+        while True:
+            readable, _, _ = select.select([conn], [], [], SHM_POLL_S)
+            read_pos = drain_shm(mm, read_pos, buf)
+            if readable:
+                try:
+                    if not conn.recv(1):
+                        break
+                except (ConnectionResetError, BrokenPipeError):
+                    break
+        # The client publishes its last audio before shutting down
+        drain_shm(mm, read_pos, buf)
+    except ValueError as e:
+        print(f"Bad audio ring: {e}", file=sys.stderr, flush=True)
+    finally:
+        mm.close()
+
+
+def receive_stream(conn, buf):
+    """Collect audio streamed over the socket until EOF."""
     while True:
         try:
-            data = conn.recv(65536)
+            n = buf.recv_from(conn)
         except (ConnectionResetError, BrokenPipeError):
             break
 
-        if len(data) == 0:
+        if n == 0:
             break
 
-        byte_buf += data
-        n_complete = (len(byte_buf) // 4) * 4
-        if n_complete > 0:
-            chunk = np.frombuffer(byte_buf[:n_complete], dtype=np.float32)
-            audio_buf = np.concatenate([audio_buf, chunk])
-            byte_buf = byte_buf[n_complete:]
+
+def receive_audio(conn, buf):
+    """Collect the client's audio into buf over whichever transport it uses."""
+    # A client using shared memory opens with SHM_HELLO carrying the ring's
+    # memfd; otherwise the first bytes are already streamed audio
+    try:
+        data, fds, _, _ = socket.recv_fds(conn, RECV_CHUNK, 1)
+    except (ConnectionResetError, BrokenPipeError):
+        return
+    if fds:
+        for fd in fds[1:]:
+            os.close(fd)
+        receive_shm(conn, fds[0], buf)
+    elif data:
+        buf.extend(data)
+        receive_stream(conn, buf)
+
+
+def handle_connection(conn):
+    """Get the mic ready, read all audio until EOF, then transcribe and send
+    the result. Runs on its own thread per client, so recording doesn't wait
+    for the model to load or for another client's transcription."""
+    with _record_lock:
+        # The client waits for H before opening its audio stream, so the
+        # headset is already in HFP by the time it looks for the device
+        restore, bt_device = prepare_bt()
+        send_message(conn, "H", bt_device or "")
+
+        buf = AudioBuffer()
+        try:
+            receive_audio(conn, buf)
+        finally:
+            # The mic is no longer needed; switch back while transcribing
+            if restore:
+                restore_bt(*restore)
+
+    audio_buf = buf.samples()
 
     if len(audio_buf) == 0:
         return
@@ -79,8 +555,15 @@ def handle_connection(conn, model):
     send_message(conn, "L", f"{audio_duration:.1f}")
     print(f"Transcribing ({audio_duration:.1f}s)...", file=sys.stderr, flush=True)
 
+    _model_ready.wait()
+    with _transcribe_lock:
+        transcribe(conn, audio_buf, audio_duration)
+
+
+def transcribe(conn, audio_buf, audio_duration):
+    """Transcribe a finished recording, streaming segments to the client."""
     t0 = time.monotonic()
-    segments, _ = model.transcribe(
+    segments, _ = _model.transcribe(
         audio_buf,
         language=LANGUAGE,
         vad_filter=True,
@@ -88,8 +571,17 @@ def handle_connection(conn, model):
             min_silence_duration_ms=500,
             speech_pad_ms=300,
         ),
+        **DECODE_OPTIONS,
     )
-    text = " ".join(seg.text.strip() for seg in segments if seg.text.strip())
+    # segments is lazy: each one is decoded as we iterate, so forward it to
+    # the client right away instead of waiting for the whole recording
+    parts = []
+    for seg in segments:
+        seg_text = seg.text.strip()
+        if seg_text:
+            parts.append(seg_text)
+            send_message(conn, "S", seg_text)
+    text = " ".join(parts)
     transcribe_duration = time.monotonic() - t0
 
     if text:
@@ -99,9 +591,16 @@ def handle_connection(conn, model):
     print(f"Done in {transcribe_duration:.1f}s.", file=sys.stderr, flush=True)
 
 
-def main():
-    model = load_model()
+def serve_connection(conn):
+    try:
+        handle_connection(conn)
+    except Exception as e:
+        print(f"Error handling request: {e}", file=sys.stderr, flush=True)
+    finally:
+        conn.close()
 
+
+def main():
     # Clean up stale socket
     try:
         os.unlink(SOCKET_PATH)
@@ -113,15 +612,13 @@ def main():
     server.listen(1)
     print(f"Listening on {SOCKET_PATH}", file=sys.stderr, flush=True)
 
+    start_bt_watcher()
+    threading.Thread(target=load_in_background, daemon=True).start()
+
     try:
         while True:
             conn, _ = server.accept()
-            try:
-                handle_connection(conn, model)
-            except Exception as e:
-                print(f"Error handling request: {e}", file=sys.stderr, flush=True)
-            finally:
-                conn.close()
+            threading.Thread(target=serve_connection, args=(conn,), daemon=True).start()
     except KeyboardInterrupt:
         print("Shutting down.", file=sys.stderr, flush=True)
     finally: